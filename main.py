@@ -1,32 +1,80 @@
+import argparse
 import csv
-import json
 import os
 import platform
+import re
 import subprocess
 import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from html import escape
 from pathlib import Path
 
+# Необязательные ускорители загрузки данных: используются, только если установлены
 try:
-    from weasyprint import HTML
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
 except ImportError:
-    print("Ошибка: библиотека WeasyPrint не найдена.")
-    print("Пожалуйста, установите ее, выполнив команду:")
-    print("pip install WeasyPrint")
-    sys.exit(1)
+    pa_csv = None
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    try:
+        from ujson import loads as _json_loads
+    except ImportError:
+        from json import loads as _json_loads
 
 
-def setup_directories():
+# Сколько записей показывать в списке выбора; остальные доступны по номеру или ID
+MAX_LISTED_RECORDS = 50
+
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# Разделитель тысяч в итоговой сумме - пробел: 25000 -> "25 000.00"
+_THOUSANDS_TO_SPACE = str.maketrans({",": " "})
+_ITEM_ROW = "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>"
+_STYLE_RE = re.compile(r"<style([^>]*)>(.*?)</style>", re.IGNORECASE | re.DOTALL)
+_THOUSANDS_COMMA_RE = re.compile(r",\d{3}$")
+_MEDIA_RE = re.compile(r"\smedia\s*=\s*[\"']?([^\"'>]*)", re.IGNORECASE)
+_LINK_RE = re.compile(r"<link[^>]+rel=[\"']stylesheet[\"'][^>]*>", re.IGNORECASE)
+
+# Ресурсы WeasyPrint текущего процесса, заполняются в _init_worker
+_worker_state = {}
+
+
+def setup_directories(debug_html=False):
     """Создает необходимые директории, если они не существуют."""
-    for dir_name in ["data", "templates", "output", "temp"]:
+    dir_names = ["data", "templates", "output"]
+    if debug_html:
+        dir_names.append("temp")
+    for dir_name in dir_names:
         Path(dir_name).mkdir(exist_ok=True)
 
 
-def find_files(directory, extensions):
-    """Рекурсивно ищет файлы с заданными расширениями в директории."""
-    found_files = []
-    for ext in extensions:
-        found_files.extend(Path(directory).rglob(f"*.{ext}"))
-    return found_files
+def _scandir_files(path, exts_set, recursive):
+    """
+    Обходит директорию за один проход и возвращает пути файлов с нужными расширениями.
+    При recursive=False просматривается только сама директория.
+    """
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        yield from _scandir_files(entry.path, exts_set, recursive)
+                elif entry.name.rpartition(".")[2].lower() in exts_set:
+                    yield entry.path
+    except PermissionError:
+        pass  # Пропускаем директории, к которым нет доступа
+
+
+def find_files(directory, extensions, recursive=True):
+    """Ищет файлы с заданными расширениями в директории, по умолчанию - рекурсивно."""
+    exts_set = {ext.lower().lstrip(".") for ext in extensions}
+    # Path нужен вызывающему коду (.suffix, .open, .stem), поэтому создаем его только на выходе
+    return [Path(p) for p in sorted(_scandir_files(directory, exts_set, recursive))]
 
 
 def select_item(items, title):
@@ -52,72 +100,134 @@ def select_item(items, title):
             print("Пожалуйста, введите число.")
 
 
+def _read_csv_rows(f, file_path):
+    """
+    Возвращает строки CSV-файла в виде словарей.
+    Если установлен pyarrow, файл разбирается его многопоточным парсером, иначе - csv.DictReader.
+    Файлы, которые pyarrow разобрать не может (например, строки с другим числом столбцов),
+    читаются через csv.DictReader.
+    """
+    if pa_csv is None:
+        return csv.DictReader(f)
+
+    # Все столбцы читаем как строки, чтобы значения совпадали с результатом csv.DictReader
+    header = next(csv.reader(f), [])
+    convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in header})
+    # Как и модуль csv, допускаем переводы строк внутри значений в кавычках
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+    try:
+        table = pa_csv.read_csv(
+            str(file_path), parse_options=parse_options, convert_options=convert_options
+        )
+    except pa.ArrowInvalid:
+        f.seek(0)
+        return csv.DictReader(f)
+    return table.to_pylist()
+
+
+def _new_invoice():
+    """Возвращает пустой счет для defaultdict в load_data."""
+    return {"invoice_id": None, "customer_name": None, "date": None, "items": []}
+
+
+def _parse_number(value):
+    """
+    Преобразует число из файла в float, допуская десятичную запятую и пробелы в разрядах.
+    Неоднозначные записи вроде "12,000" (запятая может разделять тысячи) не угадываются,
+    а вызывают ValueError.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).replace("\xa0", "").replace(" ", "")
+    if "," in text:
+        if "." in text or text.count(",") != 1 or _THOUSANDS_COMMA_RE.search(text):
+            raise ValueError(f"неоднозначный разделитель в числе {value!r}")
+        text = text.replace(",", ".")
+    return float(text)
+
+
+def _normalize_item(item, invoice_id):
+    """
+    Один раз при загрузке разбирает сумму позиции в item["_amount"] для подсчета итога.
+    Исходные значения полей сохраняются и выводятся в документе как есть.
+    """
+    amount = item.get("amount", 0)
+    try:
+        item["_amount"] = _parse_number(amount) if amount not in (None, "") else 0.0
+    except ValueError:
+        item["_amount"] = 0.0
+        print(f"Предупреждение: счет {invoice_id}, позиция {item.get('item_name')!r}: "
+              f"не удалось разобрать сумму {amount!r}, в итог она не включена.")
+    return item
+
+
+def _append_row(invoices, row):
+    """Добавляет строку данных к счету с тем же invoice_id."""
+    invoice_id = row["invoice_id"]
+    invoice = invoices[invoice_id]
+    if invoice["invoice_id"] is None:
+        invoice["invoice_id"] = invoice_id
+        invoice["customer_name"] = row.get("customer_name")
+        invoice["date"] = row.get("date")
+
+    # Обрабатываем и вложенные списки items, и плоскую структуру
+    if isinstance(row.get("items"), list):
+        invoice["items"].extend(_normalize_item(item, invoice_id) for item in row["items"])
+    else:
+        invoice["items"].append(_normalize_item({
+            "item_name": row.get("item_name"),
+            "quantity": row.get("quantity", 1),
+            "price": row.get("price", 0),
+            "amount": row.get("amount", 0),
+        }, invoice_id))
+
+
 def load_data(file_path):
     """Загружает данные из CSV или JSON файла и приводит их к единой структуре."""
     try:
-        with file_path.open("r", encoding="utf-8") as f:
-            if file_path.suffix == ".csv":
-                reader = csv.DictReader(f)
-                invoices = {}
-                for row in reader:
-                    invoice_id = row["invoice_id"]
-                    if invoice_id not in invoices:
-                        invoices[invoice_id] = {
-                            "invoice_id": invoice_id,
-                            "customer_name": row.get("customer_name"),
-                            "date": row.get("date"),
-                            "items": [],
-                        }
-                    invoices[invoice_id]["items"].append({
-                        "item_name": row.get("item_name"),
-                        "quantity": row.get("quantity", 1),
-                        "price": row.get("price", 0),
-                        "amount": row.get("amount", 0),
-                    })
-                return list(invoices.values())
-            elif file_path.suffix == ".json":
-                data = json.load(f)
-                invoices = {}
-                for record in data:
-                    invoice_id = record["invoice_id"]
-                    if invoice_id not in invoices:
-                        invoices[invoice_id] = {
-                            "invoice_id": invoice_id,
-                            "customer_name": record.get("customer_name"),
-                            "date": record.get("date"),
-                            "items": [],
-                        }
-                    # Обрабатываем и вложенные списки items, и плоскую структуру
-                    if 'items' in record and isinstance(record['items'], list):
-                        invoices[invoice_id]['items'].extend(record['items'])
-                    else:
-                        invoices[invoice_id]['items'].append({
-                            "item_name": record.get("item_name"),
-                            "quantity": record.get("quantity", 1),
-                            "price": record.get("price", 0),
-                            "amount": record.get("amount", 0),
-                        })
-                return list(invoices.values())
-    except (IOError, json.JSONDecodeError, csv.Error, KeyError) as e:
+        invoices = defaultdict(_new_invoice)
+        # find_files находит расширения без учета регистра, поэтому и здесь сравниваем так же
+        suffix = file_path.suffix.lower()
+        if suffix == ".csv":
+            with file_path.open("r", encoding="utf-8") as f:
+                for row in _read_csv_rows(f, file_path):
+                    _append_row(invoices, row)
+        elif suffix == ".json":
+            # Парсер получает байты напрямую, без промежуточного декодирования в str
+            for row in _json_loads(file_path.read_bytes()):
+                _append_row(invoices, row)
+        else:
+            return None
+
+        # Итоговая сумма считается один раз при загрузке, а не при каждой генерации
+        for invoice in invoices.values():
+            invoice["_total_amount"] = sum(item["_amount"] for item in invoice["items"])
+        return list(invoices.values())
+    except (IOError, ValueError, csv.Error, KeyError) as e:
         print(f"Ошибка при чтении или обработке файла {file_path}: {e}")
         return None
 
 
 def select_records(records):
-    """Позволяет пользователю выбрать записи для обработки по номеру в списке."""
+    """Позволяет пользователю выбрать записи для обработки по номеру в списке или по ID."""
     print("\n--- Выбор записей ---")
     if not records:
         print("Нет доступных записей.")
         return []
 
-    # Отображаем записи с номерами для выбора
-    for i, record in enumerate(records, 1):
+    id_index = {str(record.get("invoice_id")): record for record in records}
+
+    # Отображаем записи с номерами для выбора, ограничивая длину списка
+    for i, record in enumerate(records[:MAX_LISTED_RECORDS], 1):
         print(f"{i}. ID: {record.get('invoice_id', 'N/A')}, Покупатель: {record.get('customer_name', 'N/A')}")
+    if len(records) > MAX_LISTED_RECORDS:
+        print(f"... и еще {len(records) - MAX_LISTED_RECORDS} (всего {len(records)})")
 
-    print("\nВведите номер записи, несколько номеров через запятую, или 'all' для всех.")
+    print("\nВведите номер записи, несколько номеров через запятую, ID записи или 'all' для всех.")
     
     while True:
-        choice = input("Ваш выбор: ").strip().lower()
+        raw_choice = input("Ваш выбор: ").strip()
+        choice = raw_choice.lower()
         if choice == 'all':
             return records
 
@@ -150,62 +260,248 @@ def select_records(records):
                 print("Не удалось выбрать записи. Попробуйте еще раз.")
 
         except ValueError:
-            print("Ошибка. Пожалуйста, введите номера (числа) через запятую или 'all'.")
+            # Не номер из списка - пробуем найти запись по ID
+            if raw_choice in id_index:
+                return [id_index[raw_choice]]
+            print("Ошибка. Пожалуйста, введите номера (числа) через запятую, ID записи или 'all'.")
 
 
-def generate_html(template_content, record):
-    """Заполняет HTML-шаблон данными из записи."""
-    content = template_content
-    
-    # Заполняем основные поля
-    content = content.replace("{{ invoice_id }}", str(record.get("invoice_id", "")))
-    content = content.replace("{{ customer_name }}", str(record.get("customer_name", "")))
-    content = content.replace("{{ date }}", str(record.get("date", "")))
+def compile_template(template_content):
+    """
+    Разбивает шаблон на список пар (текст, имя поля) один раз перед генерацией.
+    У последней пары поле равно None.
+    """
+    # split с группой возвращает [текст, поле, текст, поле, ..., текст]
+    parts = _PLACEHOLDER_RE.split(template_content)
+    return list(zip(parts[::2], parts[1::2] + [None]))
+
 
+def filter_records_by_ids(records, ids):
+    """Возвращает записи с указанными invoice_id в порядке файла; 'all' выбирает все записи."""
+    if "all" in ids:
+        return records
+
+    # ID из JSON могут быть числами, а из командной строки приходят строки
+    wanted = set(ids)
+    selected_records = [record for record in records if str(record.get("invoice_id")) in wanted]
+    missing = wanted.difference(str(record.get("invoice_id")) for record in selected_records)
+    if missing:
+        print(f"Записи с ID не найдены: {', '.join(sorted(missing))}")
+    return selected_records
+
+
+def generate_html(template_parts, record):
+    """Заполняет заранее разобранный HTML-шаблон данными из записи."""
     # Генерируем строки таблицы для товаров
-    item_rows = ""
-    total_amount = 0
+    rows = []
+    # Значения выводятся как в исходном файле; итоговая сумма уже посчитана в load_data
     for item in record.get("items", []):
-        item_rows += "<tr>"
-        item_rows += f"<td>{item.get('item_name', '')}</td>"
-        item_rows += f"<td>{item.get('quantity', 0)}</td>"
-        item_rows += f"<td>{item.get('price', 0)}</td>"
-        item_rows += f"<td>{item.get('amount', 0)}</td>"
-        item_rows += "</tr>\n"
-        try:
-            total_amount += float(item.get("amount", 0))
-        except (ValueError, TypeError):
-            pass # Игнорируем ошибки преобразования, если сумма некорректна
+        rows.append(_ITEM_ROW.format(
+            escape(str(item.get("item_name", ""))),
+            escape(str(item.get("quantity", 0))),
+            escape(str(item.get("price", 0))),
+            escape(str(item.get("amount", 0))),
+        ))
+
+    item_rows = "\n".join(rows)
+
+    context = {
+        "invoice_id": escape(str(record.get("invoice_id", ""))),
+        "customer_name": escape(str(record.get("customer_name", ""))),
+        "date": escape(str(record.get("date", ""))),
+        "item_rows": item_rows,
+        "total_amount": format(record["_total_amount"], ",.2f").translate(_THOUSANDS_TO_SPACE),
+    }
+
+    # Собираем документ за один проход по токенам; неизвестные поля заменяются пустой строкой
+    chunks = []
+    for literal, field in template_parts:
+        chunks.append(literal)
+        if field is not None:
+            chunks.append(str(context.get(field, "")))
+    return "".join(chunks)
+
+
+def _excludes_print(tag):
+    """
+    Проверяет, что атрибут media тега исключает печать (например, media="screen").
+    Тег считается ненужным, только если каждый запрос в списке media явно указывает тип
+    носителя, отличный от print/all, и не использует отрицание "not".
+    """
+    media = _MEDIA_RE.search(tag)
+    if not media:
+        return False  # Без media стили применяются везде, в том числе при печати
+    for query in media.group(1).lower().split(","):
+        words = query.split()
+        if words and words[0] == "only":
+            words = words[1:]
+        # Пустой запрос или запрос без типа носителя, например "(max-width: 800px)",
+        # означает "all"; "not screen" включает печать
+        if not words or words[0] == "not" or words[0].startswith("(") or words[0] in ("print", "all"):
+            return False
+    return True
+
+
+def strip_unused_css(template_content):
+    """
+    Удаляет из шаблона подключаемые таблицы стилей и блоки <style>, которые по атрибуту
+    media не применяются при печати, но разбираются WeasyPrint при каждом рендеринге.
+    """
+    def drop_screen_only(match):
+        return "" if _excludes_print(match.group(0).split(">", 1)[0]) else match.group(0)
 
-    content = content.replace("{{ item_rows }}", item_rows)
-    content = content.replace("{{ total_amount }}", f"{total_amount:,.2f}".replace(",", " "))
-    
-    return content
+    template_content = _LINK_RE.sub(drop_screen_only, template_content)
+    return _STYLE_RE.sub(drop_screen_only, template_content)
+
+
+def extract_styles(template_content):
+    """
+    Вырезает блоки <style> из шаблона и возвращает шаблон без них и собранный CSS.
+    Так CSS разбирается один раз на весь запуск, а не заново для каждой записи.
+
+    Выносятся только блоки без атрибута media или с media="all"/"print": остальные
+    остаются в HTML, чтобы WeasyPrint сам применял к ним медиазапросы. Если в шаблоне
+    есть подключаемые таблицы стилей, блоки не выносятся вовсе, иначе изменится
+    порядок каскада.
+    """
+    if _LINK_RE.search(template_content):
+        return template_content, ""
+
+    css_blocks = []
+
+    def take_print_style(match):
+        media = _MEDIA_RE.search(match.group(1))
+        if media and media.group(1).strip().lower() not in ("", "all", "print"):
+            return match.group(0)
+        css_blocks.append(match.group(2))
+        return ""
+
+    template_content = _STYLE_RE.sub(take_print_style, template_content)
+    return template_content, "\n".join(css_blocks)
+
+
+def _init_worker(css_text):
+    """
+    Готовит общие для процесса ресурсы WeasyPrint: шрифты, загрузчик URL, разобранный CSS
+    и кэш изображений.
+    Объекты WeasyPrint не сериализуются, поэтому каждый процесс создает их сам один раз.
+    """
+    from weasyprint import CSS, default_url_fetcher
+    from weasyprint.text.fonts import FontConfiguration
+
+    font_config = FontConfiguration()
+    url_fetcher = default_url_fetcher
+    _worker_state["font_config"] = font_config
+    _worker_state["url_fetcher"] = url_fetcher
+    _worker_state["stylesheets"] = (
+        [CSS(string=css_text, font_config=font_config, url_fetcher=url_fetcher)]
+        if css_text else []
+    )
+    # image_cache - словарь, который WeasyPrint заполняет декодированными изображениями
+    # и переиспользует между вызовами write_pdf, если передавать один и тот же объект.
+    _worker_state["image_cache"] = {}
+
+
+def _render_one(record, template_parts, template_name, debug_html=False):
+    """Генерирует HTML и PDF для одной записи и возвращает путь к PDF."""
+    # Стили уже вынесены из template_parts в _init_worker, без него PDF вышел бы без оформления
+    if not _worker_state:
+        raise RuntimeError("_render_one вызван без _init_worker: стили шаблона не загружены")
+
+    from weasyprint import HTML
+
+    invoice_id = record.get("invoice_id", "unknown")
+
+    # Генерация HTML
+    html_content = generate_html(template_parts, record)
+    if debug_html:
+        # HTML сохраняется только для отладки, WeasyPrint получает строку напрямую
+        temp_html_path = Path("temp") / f"{invoice_id}_{template_name}.html"
+        temp_html_path.write_text(html_content, encoding="utf-8")
+
+    # Генерация PDF
+    pdf_filename = f"({invoice_id})_{template_name}.pdf"
+    output_pdf_path = Path("output") / pdf_filename
+    HTML(string=html_content, url_fetcher=_worker_state["url_fetcher"]).write_pdf(
+        output_pdf_path,
+        stylesheets=_worker_state["stylesheets"],
+        font_config=_worker_state["font_config"],
+        image_cache=_worker_state["image_cache"],
+    )
+    return output_pdf_path
+
+
+# Способ открытия файла определяется один раз при импорте
+_SYSTEM = platform.system()
+if _SYSTEM == "Windows":
+    def _open_with_system(path):
+        os.startfile(path)
+elif _SYSTEM == "Darwin":  # macOS
+    def _open_with_system(path):
+        subprocess.run(["open", str(path)], check=True)
+else:  # Linux
+    def _open_with_system(path):
+        subprocess.run(["xdg-open", str(path)], check=True)
 
 
 def open_file(path):
     """Кросс-платформенно открывает файл."""
-    system = platform.system()
     try:
-        if system == "Windows":
-            os.startfile(path)
-        elif system == "Darwin":  # macOS
-            subprocess.run(["open", path], check=True)
-        else:  # Linux
-            subprocess.run(["xdg-open", path], check=True)
+        _open_with_system(path)
     except (OSError, subprocess.CalledProcessError) as e:
         print(f"Не удалось открыть файл {path}: {e}")
 
 
+def parse_args():
+    """Разбирает аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Генератор PDF-документов из CSV/JSON и HTML-шаблонов.")
+    parser.add_argument("--data", type=Path, help="файл с данными (.csv или .json)")
+    parser.add_argument("--template", type=Path, help="HTML-шаблон")
+    parser.add_argument(
+        "--ids",
+        nargs="+",
+        metavar="ID",
+        help="invoice_id записей для генерации или 'all' для всех",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="число параллельных процессов генерации (по умолчанию - число ядер)",
+    )
+    parser.add_argument(
+        "--recursive",
+        action="store_true",
+        help="искать данные и шаблоны также во вложенных папках data/ и templates/",
+    )
+    parser.add_argument(
+        "--keep-css",
+        action="store_true",
+        help="не удалять из шаблона стили, не применяемые при печати (например, media=\"screen\")",
+    )
+    parser.add_argument(
+        "--debug-html",
+        action="store_true",
+        help="сохранять сгенерированный HTML в папку temp/ для отладки",
+    )
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs должен быть не меньше 1")
+    return args
+
+
 def main():
     """Основная функция скрипта."""
-    setup_directories()
+    args = parse_args()
+    setup_directories(args.debug_html)
 
     # 1. Загрузка данных
-    data_files = find_files("data", ["csv", "json"])
-    data_file_path = select_item(data_files, "Выберите файл с данными")
-    if not data_file_path:
-        return
+    data_file_path = args.data
+    if data_file_path is None:
+        data_files = find_files("data", ["csv", "json"], args.recursive)
+        data_file_path = select_item(data_files, "Выберите файл с данными")
+        if not data_file_path:
+            return
     
     records = load_data(data_file_path)
     if not records:
@@ -213,10 +509,12 @@ def main():
         return
 
     # 2. Загрузка шаблона
-    template_files = find_files("templates", ["html"])
-    template_file_path = select_item(template_files, "Выберите HTML-шаблон")
-    if not template_file_path:
-        return
+    template_file_path = args.template
+    if template_file_path is None:
+        template_files = find_files("templates", ["html"], args.recursive)
+        template_file_path = select_item(template_files, "Выберите HTML-шаблон")
+        if not template_file_path:
+            return
         
     try:
         template_content = template_file_path.read_text(encoding="utf-8")
@@ -225,42 +523,61 @@ def main():
         return
 
     # 3. Выбор записей
-    selected_records = select_records(records)
+    if args.ids is None:
+        selected_records = select_records(records)
+    else:
+        selected_records = filter_records_by_ids(records, args.ids)
     if not selected_records:
         print("Записи не выбраны. Завершение работы.")
         return
 
+    # WeasyPrint импортируется только перед генерацией: его CSS- и шрифтовая подсистема
+    # заметно замедляет запуск, а для --help и прерванных запусков она не нужна.
+    # Импорт здесь же проверяет установку целиком, включая нативные библиотеки (Pango),
+    # чтобы ошибка не проявилась позже как сбой пула процессов
+    try:
+        from weasyprint import CSS, HTML, default_url_fetcher
+        from weasyprint.text.fonts import FontConfiguration
+    except (ImportError, OSError) as e:
+        print(f"Ошибка: библиотека WeasyPrint не найдена или установлена не полностью ({e}).")
+        print("Пожалуйста, установите ее, выполнив команду:")
+        print("pip install WeasyPrint")
+        sys.exit(1)
+
     # 4 & 5. Генерация HTML и PDF
     print("\nНачинаю генерацию PDF...")
     generated_files = []
     template_name = template_file_path.stem
-
-    for record in selected_records:
-        invoice_id = record.get("invoice_id", "unknown")
-        
-        # Генерация HTML
-        html_content = generate_html(template_content, record)
-        temp_html_path = Path("temp") / f"{invoice_id}_{template_name}.html"
-        try:
-            temp_html_path.write_text(html_content, encoding="utf-8")
-        except IOError as e:
-            print(f"Не удалось сохранить временный HTML: {e}")
-            continue
-
-        # Генерация PDF
-        pdf_filename = f"({invoice_id})_{template_name}.pdf"
-        output_pdf_path = Path("output") / pdf_filename
-        
-        try:
-            HTML(string=html_content).write_pdf(output_pdf_path)
-            print(f"  \u2713 Создан: {output_pdf_path}")
-            generated_files.append(output_pdf_path)
-        except Exception as e:
-            print(f"  \u2717 Ошибка при создании PDF для ID {invoice_id}: {e}")
+    if not args.keep_css:
+        template_content = strip_unused_css(template_content)
+    template_content, css_text = extract_styles(template_content)
+    template_parts = compile_template(template_content)
+    max_workers = min(len(selected_records), args.jobs)
+
+    # Записи независимы друг от друга, поэтому рендерим их параллельно в отдельных процессах
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(css_text,)
+    ) as executor:
+        futures = [
+            executor.submit(_render_one, record, template_parts, template_name, args.debug_html)
+            for record in selected_records
+        ]
+        # Результаты забираем в порядке записей, чтобы вывод и "первый PDF" не зависели
+        # от того, какой процесс закончит раньше
+        for record, future in zip(selected_records, futures):
+            invoice_id = record.get("invoice_id", "unknown")
+            try:
+                output_pdf_path = future.result()
+                print(f"  \u2713 Создан: {output_pdf_path}")
+                generated_files.append(output_pdf_path)
+            except Exception as e:
+                print(f"  \u2717 Ошибка при создании PDF для ID {invoice_id}: {e}")
 
     # 6. Открытие PDF
     if generated_files:
         print("\nГенерация завершена.")
+        if args.ids is not None:
+            return  # В пакетном режиме не задаем вопросов
         open_choice = input("Открыть первый сгенерированный PDF? (y/n): ").lower()
         if open_choice == 'y':
             open_file(generated_files[0])